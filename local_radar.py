@@ -7,7 +7,7 @@ from multiple nodes (ESP8266/ESP32 or Raspberry Pi) onto a custom floorplan.
 Features:
 - Dual-mode data ingestion: USB Serial and TCP/IP Socket.
 - Interactive UI: Click and drag nodes to match physical locations.
-- Live Heatmaps: Visualizes signal coverage using Gaussian-smoothed contours.
+- Live Heatmaps: Visualizes signal coverage using Gaussian-smoothed rasters.
 - Scene Management: Toggle between full views, specific node groups, and debug logs.
 - Automatic Persistence: Saves node coordinates and names to a local JSON file.
 
@@ -16,13 +16,14 @@ License: NO
 """
 
 import serial, time, json, os, socket, threading, re
+from collections import deque
+from queue import Queue, Full, Empty
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Button
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import correlate1d
 from PIL import Image
-from datetime import datetime
 
 # ────────────────────────────────────────────────
 # CONFIGURATION & GLOBAL SETTINGS
@@ -36,19 +37,26 @@ MAX_NODES = 24
 N_NODES = MAX_NODES + 1
 TIMEOUT_SEC = 30.0             # Time before a node is considered offline
 EMA_ALPHA = 0.18               # Smoothing factor for RSSI (Exponential Moving Average)
+EMA_FRAME_SEC = 0.05           # Frame period EMA_ALPHA is defined for
 GRID_DECAY = 0.96              # How fast the heatmap fades
+SAVE_DEBOUNCE_SEC = 0.5        # Delay before node positions are written after a drag
 RPIBASE_FALLBACK = "RPIBASE"
 MCUBASE_NAME = "MCUBASE"
 
 # Data Storage
-raw_log = []
+raw_log = deque(maxlen=200)     # Recent DATA lines for the debug scene
 node_ssids = {i: "" for i in range(N_NODES)} 
 node_macs = {i: "" for i in range(N_NODES)} 
 custom_names = {i: None for i in range(N_NODES)}
 mac_to_slot = {} 
 
+# Separable Gaussian kernel for heatmap smoothing (sigma=8 cells, truncated at 3 sigma)
+GK = np.exp(-0.5 * (np.arange(-24, 25) / 8.0) ** 2).astype(np.float32)
+GK /= GK.sum()
+
 # Regex for MAC address validation in incoming data strings
 MAC_REGEX = re.compile(r'^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$')
+MAC_REGEX_B = re.compile(rb'^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$')   # Same, for raw TCP bytes
 
 # ────────────────────────────────────────────────
 # IMAGE INITIALIZATION
@@ -67,9 +75,13 @@ else:
     img_data = None
 
 # Live state variables
-signals = [-100.0] * N_NODES
-signal_smoothed = [-100.0] * N_NODES
-last_update = [0.0] * N_NODES
+signals = np.full(N_NODES, -100.0, dtype=np.float32)
+signal_smoothed = np.full(N_NODES, -100.0, dtype=np.float32)
+last_update = np.zeros(N_NODES, dtype=np.float64)
+
+# Per-node EMA factors (base stations in slots 0 and 1 react faster)
+alpha_vec = np.full(N_NODES, EMA_ALPHA, dtype=np.float32)
+alpha_vec[:2] = EMA_ALPHA * 2.5
 
 def load_positions_and_names():
     """Loads node locations and metadata from JSON file."""
@@ -86,28 +98,91 @@ def load_positions_and_names():
                 names_dict = data.get('names', {})
                 for k, v in names_dict.items():
                     if int(k) < N_NODES: custom_names[int(k)] = v
-                return pos[:N_NODES]
+                return pos[:N_NODES].astype(np.float32)
         except Exception as e:
             print(f"Error loading {POS_FILE}: {e}")
     # Default grid layout if file doesn't exist
-    return np.array([[(i % 4) * (VIEW_LIMIT_X//5) + 100, (i // 4) * (VIEW_LIMIT_Y//5) + 100] for i in range(N_NODES)], dtype=float)
+    return np.array([[(i % 4) * (VIEW_LIMIT_X//5) + 100, (i // 4) * (VIEW_LIMIT_Y//5) + 100] for i in range(N_NODES)], dtype=np.float32)
 
 node_coords = load_positions_and_names()
 
 def save_positions_and_names():
     """Saves current node locations and metadata to JSON file."""
     data = {
-        'fixed': node_coords.tolist(), 
+        'fixed': np.round(node_coords.astype(float), 2).tolist(),   # float32 -> clean 2-decimal JSON
         'names': {str(k): v for k, v in custom_names.items() if v is not None}
     }
     with open(POS_FILE, 'w') as f:
         json.dump(data, f, indent=2)
+    last_saved_coords[:] = node_coords
+
+last_saved_coords = node_coords.copy()
+save_timer = None
+
+def flush_positions():
+    """Writes node positions only if they changed since the last save."""
+    if not np.array_equal(node_coords, last_saved_coords):
+        save_positions_and_names()
+
+def schedule_save():
+    """Debounces saves: writes once SAVE_DEBOUNCE_SEC after the last drag ends."""
+    global save_timer
+    if save_timer is not None:
+        save_timer.cancel()
+    save_timer = threading.Timer(SAVE_DEBOUNCE_SEC, flush_positions)
+    save_timer.start()
 
 # ────────────────────────────────────────────────
 # NETWORKING (TCP SERVER)
 # ────────────────────────────────────────────────
 net_status = "DISCONNECTED"
 
+def net_slot_for(mac):
+    """Returns the RPI neighbor slot (11+) for a MAC, claiming a free or timed-out slot on first sight."""
+    slot = mac_to_slot.get(mac)
+    if slot is None:
+        used = set(mac_to_slot.values())
+        free = [i for i in range(11, N_NODES) if i not in used]
+        if free:
+            slot = free[0]
+        else:
+            slot = 11 + int(np.argmin(last_update[11:]))
+            if time.time() - last_update[slot] <= TIMEOUT_SEC:
+                return None
+            for old_mac in [m for m, i in mac_to_slot.items() if i == slot]:
+                del mac_to_slot[old_mac]
+        mac_to_slot[mac] = slot
+    return slot
+
+def handle_net_line(line):
+    """
+    Parses one raw 'DATA' line from the RPI sender without decoding it as a whole.
+    Format: DATA,<RSSI_0>,<MAC_0>,<RSSI_1>,<SSID_1>,<MAC_1>...
+    The sender itself goes to slot 0; each neighbor is mapped to a slot by MAC.
+    """
+    raw_log.append(b"NET: " + line)
+    parts = [p.strip() for p in line.split(b',')]
+    now = time.time()
+    try:
+        if len(parts) >= 3 and MAC_REGEX_B.match(parts[2]):
+            signals[0] = float(parts[1])
+            last_update[0] = now
+            node_macs[0] = parts[2].decode('ascii').upper()
+        for k in range(3, len(parts) - 2, 3):
+            rssi_b, ssid_b, mac_b = parts[k:k + 3]
+            if not MAC_REGEX_B.match(mac_b):
+                continue
+            mac = mac_b.decode('ascii').upper()
+            slot = net_slot_for(mac)
+            if slot is None:
+                continue
+            signals[slot] = float(rssi_b)
+            last_update[slot] = now
+            node_macs[slot] = mac
+            node_ssids[slot] = ssid_b.decode('utf-8', errors='ignore')
+    except ValueError:
+        pass
+
 def network_listener():
     """Background thread to handle incoming data from WiFi-connected nodes."""
     global signals, last_update, net_status, node_ssids, node_macs, raw_log, mac_to_slot
@@ -117,23 +192,22 @@ def network_listener():
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 s.bind((host, SERVER_PORT))
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
                 s.listen(1)
                 net_status = "LISTENING"
                 conn, addr = s.accept()
                 with conn:
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     net_status = "CONNECTED"
+                    buf = b''   # Holds a partial line across recv() calls
                     while True:
-                        data = conn.recv(4096).decode('utf-8', errors='ignore')
+                        data = conn.recv(65536)
                         if not data: break
-                        # Expected format: "DATA, -RSSI, [SSID], [MAC]"
-                        for line in data.strip().split('\n'):
-                            if "DATA" in line:
-                                raw_log.append(f"NET: {line}")
-                                parts = [p.strip() for p in line.split(',')]
-                                # Process logical slots for network nodes
-                                # (Omitted internal logic for brevity - matches user original)
-                                # ... process parts ...
-                                pass # Logic remains in your original flow
+                        buf += data
+                        while b'\n' in buf:
+                            line, buf = buf.split(b'\n', 1)
+                            if b"DATA" in line:
+                                handle_net_line(line.strip())
         except Exception:
             net_status = "ERR"
             time.sleep(2)
@@ -163,14 +237,35 @@ plt.subplots_adjust(left=0.01, right=0.99, top=0.92, bottom=0.06)
 fig.patch.set_facecolor('#FFFFFF')
 
 if img_data is not None:
-    ax.imshow(img_data, extent=[0, VIEW_LIMIT_X, 0, VIEW_LIMIT_Y], alpha=1.0, zorder=0)
+    # The floorplan is a static part of the blit background; downsample it to display
+    # resolution once so background snapshots (resize, scene change) stay cheap
+    target_w = int(FIG_W * fig.dpi)
+    if img_w > target_w:
+        img_small = Image.fromarray(img_data).resize((target_w, int(img_h * target_w / img_w)), Image.BILINEAR)
+        img_data = np.asarray(img_small)
+    ax.imshow(img_data, extent=[0, VIEW_LIMIT_X, 0, VIEW_LIMIT_Y], alpha=1.0, interpolation='nearest', zorder=0)
 
 current_scene_idx = 0
 last_scene_idx = 0 
-contour_objs = []
+
+# Heatmap rasters (one per node group), created once and updated in place
+ds = 8                         # Grid downsampling factor (pixels per cell)
+gx, gy = int(VIEW_LIMIT_X // ds), int(VIEW_LIMIT_Y // ds)
+heat_usb = ax.imshow(np.zeros((gy, gx)), extent=[0, VIEW_LIMIT_X, 0, VIEW_LIMIT_Y], cmap='Blues', alpha=0.3,
+                     zorder=10, animated=True, origin='lower', interpolation='bilinear')
+heat_rpi = ax.imshow(np.zeros((gy, gx)), extent=[0, VIEW_LIMIT_X, 0, VIEW_LIMIT_Y], cmap='Reds', alpha=0.3,
+                     zorder=11, animated=True, origin='lower', interpolation='bilinear')
 node_scatter = ax.scatter([], [], s=15, c='black', edgecolors='none', zorder=60, animated=True)
 texts = [ax.text(0, 0, '', fontsize=6, color='black', ha='center', va='top', zorder=61, animated=True) for _ in range(N_NODES)]
-bottom_header = fig.text(0.02, 0.02, "", fontsize=6, color='black', family='monospace')
+# The status line lives on its own invisible axes so the blitter can redraw it
+ax_hdr = fig.add_axes([0.0, 0.0, 0.44, 0.05], frameon=False)
+ax_hdr.axis('off')
+bottom_header = ax_hdr.text(0.02, 0.02, "", transform=fig.transFigure, fontsize=6, color='black',
+                            family='monospace', animated=True)
+
+# Last rendered label/position per node, so unchanged text isn't re-laid out every frame
+_last_label = [""] * N_NODES
+_last_pos = [(None, None)] * N_NODES
 
 debug_console = ax.text(0.01, 0.06, "", transform=ax.transAxes, fontsize=5, color='black',
                         family='monospace', va='bottom', zorder=100, wrap=False,
@@ -182,20 +277,118 @@ btn_scene = Button(ax_btn, 'TOGGLE SCENE', color='#EEEEEE', hovercolor='skyblue'
 btn_scene.label.set_fontsize(6)
 btn_scene.on_clicked(lambda e: globals().update(current_scene_idx=(current_scene_idx + 1) % 4))
 
-grid_usb, grid_rpi = None, None
+# Heatmap grids (float32, allocated once and updated in place every frame)
+grid_usb = np.zeros((gy, gx), dtype=np.float32)
+grid_rpi = np.zeros_like(grid_usb)
+last_frame_t = time.monotonic()   # EMA timebase; immune to wall-clock steps (NTP, no RTC)
+last_header_sec = 0      # Wall-clock second the status line was last rendered for
+
+# Node groups: slot 0 and slots 11+ are RPI-reported, slots 1-10 come from the USB collector
+rpi_mask = np.zeros(N_NODES, dtype=bool)
+rpi_mask[0] = True
+rpi_mask[11:] = True
+usb_mask = ~rpi_mask
+rpi_idx = np.where(rpi_mask)[0]
+usb_idx = np.where(usb_mask)[0]
+
+# Nodes listed in each scene: 0 = all nodes, 1 = USB group, 2 = RPI group, 3 = debug log
+all_mask = np.ones(N_NODES, dtype=bool)
+scene_masks = (all_mask, usb_mask, rpi_mask, all_mask)
+
+# Square heatmap stamp painted around each node (offsets in grid cells)
+STAMP_R = 15
+stamp_dy, stamp_dx = np.mgrid[-STAMP_R:STAMP_R, -STAMP_R:STAMP_R]
+
+def stamp_nodes(grid, ix, iy, intens):
+    """Splats one square stamp per node into grid, keeping the per-cell maximum."""
+    yy = iy[:, None, None] + stamp_dy
+    xx = ix[:, None, None] + stamp_dx
+    vals = np.broadcast_to(intens[:, None, None], yy.shape)
+    ok = (yy >= 0) & (yy < grid.shape[0]) & (xx >= 0) & (xx < grid.shape[1])
+    np.maximum.at(grid, (yy[ok], xx[ok]), vals[ok])
+
+def paint_frame(signals, smoothed, last_update, coords, grid_usb, grid_rpi, rpi_idx, usb_idx, now, steps=1.0, paint=True):
+    """
+    Advances the live state by one frame in a single pass over the node arrays:
+    fades both grids, expires timed-out nodes, applies the EMA and stamps every
+    active node into its group's grid. Returns the mask of active nodes.
+
+    `steps` is the elapsed time in nominal EMA frames; the EMA uses the
+    closed form 1 - (1 - alpha)^steps and the grids fade by GRID_DECAY^steps,
+    so the frame interval doesn't change smoothing or fade speed.
+    With paint=False only the node state is advanced and the grids are left alone.
+    """
+    stale = (now - last_update) > TIMEOUT_SEC
+    signals[stale] = -100.0
+    active = signals > -99
+    target = np.where(active, signals, np.float32(-100.0))
+    alpha_eff = 1.0 - (1.0 - alpha_vec) ** np.float32(steps)
+    smoothed += alpha_eff * (target - smoothed)
+    if not paint:
+        return active
+
+    decay = np.float32(GRID_DECAY ** steps)   # GRID_DECAY is per nominal EMA frame
+    grid_usb *= decay
+    grid_rpi *= decay
+    ix = (coords[:, 0] // ds).astype(int)
+    iy = (coords[:, 1] // ds).astype(int)
+    intens = np.clip((smoothed + 95) / 60, 0, 1)
+    rpi, usb = rpi_idx[active[rpi_idx]], usb_idx[active[usb_idx]]
+    stamp_nodes(grid_rpi, ix[rpi], iy[rpi], intens[rpi])
+    stamp_nodes(grid_usb, ix[usb], iy[usb], intens[usb])
+    return active
+
+smooth_tmp = np.empty_like(grid_usb)   # Row-pass scratch buffer (worker thread only)
+
+def smooth(grid, out):
+    """Gaussian-blurs a heatmap grid into `out` as two 1D passes (rows, then columns)."""
+    correlate1d(grid, GK, axis=0, output=smooth_tmp, mode='reflect')
+    correlate1d(smooth_tmp, GK, axis=1, output=out, mode='reflect')
+    return out
+
+# Smoothing runs off the GUI thread: update() posts grid snapshots into a
+# single-slot queue and renders whichever smoothed pair was published last.
+# The worker alternates between two preallocated output pairs so it never
+# writes into the pair currently on display.
+smooth_q = Queue(maxsize=1)
+smooth_bufs = [(np.zeros_like(grid_usb), np.zeros_like(grid_usb)) for _ in range(2)]
+smoothed_grids = smooth_bufs[1]
+
+def smooth_worker():
+    """Background thread that blurs the latest posted (usb, rpi) grids."""
+    global smoothed_grids
+    k = 0
+    while True:
+        g_usb, g_rpi = smooth_q.get()
+        out_usb, out_rpi = smooth_bufs[k]
+        smooth(g_usb, out_usb)
+        smooth(g_rpi, out_rpi)
+        smoothed_grids = smooth_bufs[k]   # Publish both at once
+        k ^= 1
+
+threading.Thread(target=smooth_worker, daemon=True).start()
 
 def update(frame):
-    """Main animation update loop (called at ~20fps)."""
-    global signals, signal_smoothed, last_update, contour_objs, ser, grid_usb, grid_rpi, serial_status, raw_log, last_scene_idx
+    """Main animation update loop (called at ~10fps)."""
+    global signals, signal_smoothed, last_update, ser, serial_status, raw_log, last_scene_idx, last_frame_t, last_header_sec
     now = time.time()
+    frame_t = time.monotonic()
+    steps = max(0.0, (frame_t - last_frame_t) / EMA_FRAME_SEC)
+    last_frame_t = frame_t
     
     # Check for Scene Change
     scene_changed = (current_scene_idx != last_scene_idx)
+    left_debug = scene_changed and last_scene_idx == 3
     last_scene_idx = current_scene_idx
+    heatmap_on = current_scene_idx != 3   # Debug scene shows no heatmap, so skip the grid work
 
-    # Update Status Text
-    base_title = "REALTIME WIFI VIS"
-    bottom_header.set_text(f"{base_title} | SERIAL: {serial_status} | TCP: {net_status} | {datetime.now().strftime('%H:%M:%S')}")
+    # Update Status Text (the clock only ticks once per second)
+    sec = int(now)
+    if sec != last_header_sec:
+        base_title = "REALTIME WIFI VIS"
+        clock = time.strftime('%H:%M:%S', time.localtime(now))
+        bottom_header.set_text(f"{base_title} | SERIAL: {serial_status} | TCP: {net_status} | {clock}")
+        last_header_sec = sec
 
     # Process USB Serial Data
     if ser and ser.is_open:
@@ -212,10 +405,74 @@ def update(frame):
         ser, serial_status = connect_serial()
 
     # Calculate Smoothed Signals & Heatmap Grids
-    # (Gaussian filter and grid update logic)
-    # ... logic remains as per original ...
+    if left_debug:
+        # Grids were frozen while in the debug scene; start fresh instead of snapping back stale
+        grid_usb.fill(0)
+        grid_rpi.fill(0)
+        try:
+            smooth_q.get_nowait()   # Drop a snapshot still pending from before the debug scene
+        except Empty:
+            pass
+        for pair in smooth_bufs:
+            for buf in pair:
+                buf.fill(0)
+    active = paint_frame(signals, signal_smoothed, last_update, node_coords, grid_usb, grid_rpi, rpi_idx, usb_idx, now, steps,
+                         paint=heatmap_on)
+
+    listed = active & scene_masks[current_scene_idx]
+    shown = []
+    for i in range(N_NODES):
+        s_val = signal_smoothed[i]
+        if not listed[i]:
+            texts[i].set_visible(False)
+            continue
+
+        x, y = node_coords[i]
+        shown.append(i)
+        if custom_names[i]:
+            name = custom_names[i]
+        elif i == 0:
+            name = RPIBASE_FALLBACK
+        elif i == 1:
+            name = MCUBASE_NAME
+        else:
+            name = node_ssids[i] or f"NODE {i}"
+        label = f"{name}\n{int(s_val)} dB"
+        if label != _last_label[i]:
+            texts[i].set_text(label)
+            _last_label[i] = label
+        pos = (x, y - 10)
+        if pos != _last_pos[i]:
+            texts[i].set_position(pos)
+            _last_pos[i] = pos
+        texts[i].set_visible(True)
+    node_scatter.set_offsets(node_coords[shown])
+
+    if not heatmap_on:
+        debug_console.set_text("\n".join(l.decode('utf-8', errors='ignore') if isinstance(l, bytes) else l
+                                          for l in list(raw_log)[-12:]))
+        debug_console.set_visible(True)
+        heat_usb.set_visible(False)
+        heat_rpi.set_visible(False)
+    else:
+        debug_console.set_visible(False)
+        try:
+            smooth_q.put_nowait((grid_usb.copy(), grid_rpi.copy()))
+        except Full:
+            pass   # Worker still busy with the previous frame
+        sm_usb, sm_rpi = smoothed_grids
+        heat_usb.set_data(sm_usb)
+        heat_usb.set_clim(0, max(grid_usb.max(), 1e-3))
+        heat_usb.set_visible(current_scene_idx != 2)
+        heat_rpi.set_data(sm_rpi)
+        heat_rpi.set_clim(0, max(grid_rpi.max(), 1e-3))
+        heat_rpi.set_visible(current_scene_idx != 1)
 
-    return [node_scatter, debug_console] + texts + contour_objs
+    # Only hand visible artists to the blitter
+    artists = [node_scatter, bottom_header]
+    artists.extend(t for t in texts if t.get_visible())
+    artists.extend(a for a in (debug_console, heat_usb, heat_rpi) if a.get_visible())
+    return artists
 
 # ────────────────────────────────────────────────
 # INTERACTION HANDLERS
@@ -226,18 +483,19 @@ def on_press(event):
     """Detects if a user clicked on a node to drag it."""
     global dragging_node
     if event.inaxes == ax and event.xdata:
-        dists = np.sqrt((node_coords[:,0]-event.xdata)**2 + (node_coords[:,1]-event.ydata)**2)
-        if np.min(dists) < 40: 
-            dragging_node = np.argmin(dists)
+        d2 = (node_coords[:,0]-event.xdata)**2 + (node_coords[:,1]-event.ydata)**2
+        j = int(np.argmin(d2))
+        if d2[j] < 40**2:
+            dragging_node = j
 
 # Connect UI Events
 fig.canvas.mpl_connect('button_press_event', on_press)
-fig.canvas.mpl_connect('button_release_event', lambda e: (save_positions_and_names(), globals().update(dragging_node=None)) if dragging_node is not None else None)
+fig.canvas.mpl_connect('button_release_event', lambda e: (schedule_save(), globals().update(dragging_node=None)) if dragging_node is not None else None)
 fig.canvas.mpl_connect('motion_notify_event', lambda e: node_coords.__setitem__(dragging_node, [e.xdata, e.ydata]) if dragging_node is not None and e.inaxes==ax else None)
 
 # Run
 ax.set_xlim(0, VIEW_LIMIT_X)
 ax.set_ylim(0, VIEW_LIMIT_Y)
 ax.axis('off')
-ani = FuncAnimation(fig, update, interval=50, blit=True, cache_frame_data=False)
+ani = FuncAnimation(fig, update, interval=100, blit=True, cache_frame_data=False)
 plt.show()
@@ -2,8 +2,9 @@
 """
 Raspberry Pi WiFi Neighbor Collector
 ====================================
-This script scans for nearby WiFi Access Points using 'nmcli' and relays the 
-signal data (RSSI, SSID, MAC) to the Python Visualizer Dashboard via TCP.
+This script scans for nearby WiFi Access Points using nl80211 (via pyroute2) or
+'nmcli' and relays the signal data (RSSI, SSID, MAC) to the Python Visualizer
+Dashboard via TCP.
 
 Role:
 - Acts as a high-power "Anchor" node.
@@ -12,6 +13,8 @@ Role:
 Requirements:
 - A Raspberry Pi with WiFi (Pi 3, 4, 5, or Zero W).
 - NetworkManager installed (`sudo apt install network-manager`).
+- Optional: `pip install pyroute2` to read scan results over netlink instead of
+  forking nmcli (forcing a fresh RF scan additionally needs root / CAP_NET_ADMIN).
 - The Dashboard PC and the Pi must be on the same local network.
 
 Author: [richharrisonline]
@@ -21,8 +24,26 @@ License: NO
 import subprocess
 import time
 import socket
+import errno
+import threading
+from collections import deque
+import heapq
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import random
+import logging
 import re
 
+try:
+    # Optional: direct nl80211 access
+    from pyroute2 import IW, IPRoute
+    from pyroute2.netlink import NLM_F_REQUEST, NLM_F_DUMP
+    from pyroute2.netlink.exceptions import NetlinkError
+    from pyroute2.netlink.nl80211 import nl80211cmd, NL80211_NAMES
+except ImportError:
+    IW = IPRoute = None
+    NetlinkError = OSError
+
 # ────────────────────────────────────────────────
 # CONFIGURATION – MATCH THESE TO YOUR DASHBOARD
 # ────────────────────────────────────────────────
@@ -30,121 +51,376 @@ SERVER_IP = "192.168.0.168"       # IP Address of the PC running the dashboard
 SERVER_PORT = 65432               # Must match SERVER_PORT in your visualizer code
 INTERFACE = "wlan0"               # WiFi interface name
 SCAN_INTERVAL = 3.0               # Frequency of updates (seconds)
+MAX_NEIGHBORS = 12                # Report only the strongest N APs to keep data packets small
+SUBPROCESS_TIMEOUT = 8.0          # Kill a hung nmcli/iw call (e.g. RF driver stall) after this many seconds
+RESCAN_EVERY = 10                 # Force a fresh RF scan every N cycles (~30s); otherwise use nmcli's cache
+SSID_REFRESH_EVERY = 20           # Re-read the Pi's own SSID every N cycles (it rarely changes)
+RETRY_MAX = 60.0                  # Upper bound for the reconnect backoff (seconds)
+RSSI_BUCKET_DB = 3                # RSSI is compared in floor buckets this wide (dBm); moves within one don't count
+FORCE_SEND_EVERY = 5              # Send a full frame at least every N cycles (keep < dashboard TIMEOUT_SEC)
+HEARTBEAT = b"HB\n"               # Sent instead of an unchanged frame (ignored by the dashboard)
+NL_MAX_FAILURES = 3               # Give up on nl80211 after this many consecutive failed scans
+BACKLOG_FRAMES = 8                # Frames kept while the dashboard is unreachable (oldest dropped first)
+
+# nmcli -t -e yes line with SIGNAL already peeled off: SSID:BSSID, where ':' inside
+# values is escaped as '\:' and '\' as '\\'. The BSSID is anchored at the end, so
+# the SSID can be matched greedily.
+SCAN_RE = re.compile(r'^(.*):((?:[0-9A-Fa-f]{2}\\:){5}[0-9A-Fa-f]{2})$')
+NMCLI_ESCAPE_RE = re.compile(r'\\(.)')
+
+# Signal line in raw `iw <if> link` output
+RSSI_RE = re.compile(rb'signal: (-\d+) dBm')
+
+# The DATA frame is plain CSV, one frame per line: SSIDs must not contain ',' or newlines
+SSID_UNSAFE = str.maketrans(',\r\n', '   ')
 
 # ────────────────────────────────────────────────
 # SYSTEM UTILITIES
 # ────────────────────────────────────────────────
 
+own_mac_cache = None    # Hardware MAC, read once
+own_ssid_cache = None   # Connected SSID, refreshed every SSID_REFRESH_EVERY calls
+own_info_calls = 0
+warned = set()          # Own-info sources that already logged a failure
+iw = None               # nl80211 socket for scans (pyroute2), None when unavailable
+iw_link = None          # Separate socket for link queries, so they never wait behind a scan
+if_index = None
+nl_failures = 0         # Consecutive failed nl80211 scans
+
+def open_nl80211():
+    """Opens the nl80211 netlink sockets for INTERFACE, leaving them None if unavailable."""
+    global iw, iw_link, if_index
+    if IW is None:
+        return
+    try:
+        with IPRoute() as ipr:
+            if_index = ipr.link_lookup(ifname=INTERFACE)[0]
+        iw = IW()
+        iw_link = IW()
+    except Exception as e:
+        print(f"[!] nl80211 unavailable ({e}), using nmcli.")
+        if iw is not None:
+            iw.close()
+        iw = iw_link = None
+
+def link_rssi_nl80211():
+    """Returns the signal (dBm) of the current association via nl80211, or None."""
+    for sta in iw_link.get_stations(if_index):
+        info = sta.get_attr('NL80211_ATTR_STA_INFO')
+        signal = info.get_attr('NL80211_STA_INFO_SIGNAL') if info else None
+        if signal is not None:
+            return signal - 256 if signal > 127 else signal   # Kernel reports an s8
+    return None
+
+def warn_once(source, err):
+    """Logs the first failure of an own-info source instead of repeating it every cycle."""
+    if source not in warned:
+        warned.add(source)
+        logging.warning("%s failed (%s); using a default value", source, err)
+
 def get_own_info():
     """
     Retrieves the Raspberry Pi's own WiFi details (The Anchor).
-    Uses 'iw' and system files to bypass standard scanning.
+    Uses system files and nl80211 where possible; MAC and SSID are cached
+    so a normal cycle forks no subprocesses.
     """
-    try:
-        # Get hardware MAC address
-        mac = subprocess.check_output(["cat", f"/sys/class/net/{INTERFACE}/address"]).decode().strip()
-    except:
-        mac = "00:00:00:00:00:00"
+    global own_mac_cache, own_ssid_cache, own_info_calls
+    if own_mac_cache is None:
+        try:
+            # Hardware MAC address never changes, so read it once
+            with open(f"/sys/class/net/{INTERFACE}/address") as f:
+                own_mac_cache = f.read().strip()
+        except OSError as e:
+            warn_once("MAC lookup", e)
+    mac = own_mac_cache or "00:00:00:00:00:00"
 
-    try:
-        # Get the SSID the Pi is currently connected to
-        ssid = subprocess.check_output(["iwgetid", "-r"]).decode().strip()
-    except:
-        ssid = "UNKNOWN_RPI"
+    if own_ssid_cache is None or own_info_calls % SSID_REFRESH_EVERY == 0:
+        try:
+            # Get the SSID the Pi is currently connected to
+            own_ssid_cache = subprocess.check_output(["iwgetid", "-r"], timeout=SUBPROCESS_TIMEOUT).decode().strip()
+        except (subprocess.SubprocessError, OSError, UnicodeDecodeError) as e:
+            warn_once("iwgetid", e)
+            own_ssid_cache = None   # Retry on the next call
+    own_info_calls += 1
+    ssid = own_ssid_cache or "UNKNOWN_RPI"
 
-    try:
-        # Extract signal strength of the current connection
-        link = subprocess.check_output(["iw", INTERFACE, "link"]).decode()
-        rssi_match = re.search(r'signal: (-\d+) dBm', link)
-        rssi = int(rssi_match.group(1)) if rssi_match else -50
-    except:
-        rssi = -50
+    rssi = None
+    if iw_link is not None:
+        try:
+            rssi = link_rssi_nl80211()
+        except (NetlinkError, OSError) as e:
+            warn_once("nl80211 link", e)
+            rssi = None   # Fall back to iw link below
+    if rssi is None:
+        try:
+            # Extract signal strength of the current connection
+            link = subprocess.check_output(["iw", INTERFACE, "link"], timeout=SUBPROCESS_TIMEOUT)
+            rssi_match = RSSI_RE.search(link)
+            rssi = int(rssi_match.group(1)) if rssi_match else -50
+        except (subprocess.SubprocessError, OSError, ValueError) as e:
+            warn_once("iw link", e)
+            rssi = -50
 
     return rssi, mac, ssid
 
-def scan_wifi():
+def scan_wifi_nl80211(rescan=False):
     """
-    Uses NetworkManager (nmcli) to perform a quick background scan of nearby APs.
-    Converts 0-100 quality scores into approximate dBm values.
+    Reads nearby APs with a single nl80211 request (no subprocesses).
+    Normally this dumps the kernel's cached scan results (NL80211_CMD_GET_SCAN)
+    without triggering a scan; `rescan` triggers a fresh one first when permitted.
+    Signal strength is reported by the driver in real dBm.
     """
+    results = None
+    if rescan:
+        try:
+            results = iw.scan(if_index)
+        except Exception:
+            results = None   # Triggering needs CAP_NET_ADMIN; the cache is still readable
+    if results is None:
+        msg = nl80211cmd()
+        msg['cmd'] = NL80211_NAMES['NL80211_CMD_GET_SCAN']
+        msg['attrs'] = [['NL80211_ATTR_IFINDEX', if_index]]
+        results = iw.nlm_request(msg, msg_type=iw.prid, msg_flags=NLM_F_REQUEST | NLM_F_DUMP)
+
+    networks = []
+    for msg in results:
+        bss = msg.get_attr('NL80211_ATTR_BSS')
+        if bss is None:
+            continue
+        mac = bss.get_attr('NL80211_BSS_BSSID')
+        ies = bss.get_attr('NL80211_BSS_INFORMATION_ELEMENTS') or {}
+        ssid = ies.get('SSID', b'')
+        if isinstance(ssid, bytes):
+            ssid = ssid.decode('utf-8', errors='ignore')
+        signal = bss.get_attr('NL80211_BSS_SIGNAL_MBM')
+        if isinstance(signal, dict):
+            # Newer pyroute2 decodes mBm to {'SIGNAL_STRENGTH': {'VALUE': dBm, ...}}
+            dbm = int(signal['SIGNAL_STRENGTH']['VALUE'])
+        else:
+            dbm = int(signal) // 100
+        if ssid and mac:
+            networks.append((ssid, dbm, mac))
+
+    return heapq.nlargest(MAX_NEIGHBORS, networks, key=lambda x: x[1])
+
+def parse_nmcli(lines):
+    """Yields (ssid, dbm, mac) for each usable line of `nmcli -t -e yes` scan output."""
+    for line in lines:
+        rest, _, signal = line.rstrip('\n').rpartition(':')
+        m = SCAN_RE.match(rest)
+        if not m or not signal.isdigit():
+            continue
+        ssid = NMCLI_ESCAPE_RE.sub(r'\1', m.group(1))
+        mac = m.group(2).replace('\\', '')
+        # Rough conversion from % quality to dBm, in integer arithmetic
+        dbm = (int(signal) >> 1) - 100
+        if ssid:
+            yield ssid, dbm, mac
+
+def scan_wifi(rescan=False):
+    """
+    Reads nearby APs over nl80211 when available, falling back to NetworkManager
+    (nmcli). Either way a new RF scan is only triggered when `rescan` is set;
+    otherwise the cached list is returned.
+    Converts nmcli's 0-100 quality scores into approximate dBm values.
+    """
+    global iw, nl_failures
+    if iw is not None:
+        try:
+            networks = scan_wifi_nl80211(rescan)
+            nl_failures = 0
+            return networks
+        except Exception as e:
+            # Transient errors (EBUSY, a dump interrupted by BSS changes) only cost
+            # this cycle; a missing interface or permission, or repeated failures, disable nl80211
+            nl_failures += 1
+            code = getattr(e, 'code', None) or getattr(e, 'errno', None)
+            if code in (errno.EPERM, errno.ENODEV) or nl_failures >= NL_MAX_FAILURES:
+                print(f"[!] nl80211 scan failed ({e}), switching to nmcli.")
+                iw.close()
+                iw = None
+            else:
+                print(f"[!] nl80211 scan failed ({e}), using nmcli for this cycle.")
+
     try:
-        # -t (terse): easy to parse, -f: specific fields
-        cmd = "nmcli -t -f SSID,BSSID,SIGNAL dev wifi list"
-        output = subprocess.check_output(cmd, shell=True).decode('utf-8')
-        
-        networks = []
-        for line in output.strip().split('\n'):
-            parts = line.split(':')
-            # nmcli separates MAC parts by ':', so we reconstruct the full BSSID
-            if len(parts) >= 8: 
-                ssid = parts[0]
-                mac = ":".join(parts[1:7]).replace('\\', '')
-                try:
-                    signal_quality = int(parts[7])
-                    # Rough conversion from % quality to dBm
-                    dbm = (signal_quality / 2) - 100 
-                    if ssid: 
-                        networks.append((ssid, int(dbm), mac))
-                except:
-                    continue
-
-        # Sort by signal strength (descending)
-        networks.sort(key=lambda x: x[1], reverse=True)
-        return networks[:12]  # Limit to top 12 to keep data packets small
+        # -t (terse) -e yes (escape ':'): easy to parse, -f: specific fields,
+        # --rescan: avoid stalling the driver every cycle
+        cmd = ["nmcli", "-t", "-e", "yes", "-f", "SSID,BSSID,SIGNAL", "dev", "wifi", "list",
+               "--rescan", "yes" if rescan else "no"]
+        # Stream stdout so lines are parsed while nmcli is still writing, keeping
+        # only the strongest MAX_NEIGHBORS in a bounded heap
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, encoding='utf-8', errors='ignore') as proc:
+            watchdog = threading.Timer(SUBPROCESS_TIMEOUT, proc.kill)   # Ends the read loop if nmcli hangs
+            watchdog.start()
+            try:
+                networks = heapq.nlargest(MAX_NEIGHBORS, parse_nmcli(proc.stdout), key=lambda x: x[1])
+            finally:
+                watchdog.cancel()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        return networks
 
     except Exception as e:
         print(f"Scan error: {e}")
         return []
 
-def build_data_line():
+scan_pool = ThreadPoolExecutor(max_workers=1)
+scan_future = None
+last_networks = []      # Last completed scan, reused while a scan is overdue
+
+def build_data_line(rescan=False):
     """
-    Packages 'own info' and 'neighbor info' into a CSV string compatible
-    with the Dashboard's network parser.
+    Packages 'own info' and 'neighbor info' into a newline-terminated CSV
+    frame (bytes) compatible with the Dashboard's network parser, ready to be
+    written with a single send.
+    Returns (frame, signature); the signature only changes when the reported
+    MACs change or an RSSI moves to another RSSI_BUCKET_DB bucket.
     """
+    global scan_future, last_networks
+    # Run the scan on the pool while the Pi's own info is collected here. A scan
+    # still running from an earlier cycle (hung nmcli) is waited on, not re-queued.
+    if scan_future is None or scan_future.done():
+        scan_future = scan_pool.submit(scan_wifi, rescan)
     own_rssi, own_mac, own_ssid = get_own_info()
-    networks = scan_wifi()
+    try:
+        last_networks = scan_future.result(timeout=SCAN_INTERVAL * 2)
+    except FutureTimeout:
+        print("[!] Scan still running, reusing last results.")
+    networks = last_networks
 
-    # Format: DATA, <RSSI_0>, <MAC_0>, <RSSI_1>, <SSID_1>, <MAC_1>...
+    # Format: DATA,<RSSI_0>,<MAC_0>,<RSSI_1>,<SSID_1>,<MAC_1>... (same CSV as the USB collector)
     parts = ["DATA", str(own_rssi), own_mac]
+    self_macs = {own_mac.lower()}   # Identities never reported as neighbors (add other interfaces here)
+    buckets = [(own_mac, own_rssi // RSSI_BUCKET_DB)]
 
     for ssid, rssi, mac in networks:
         # Don't report self as a neighbor
-        if mac.lower() == own_mac.lower():
+        if mac.lower() in self_macs:
             continue
-        parts.append(str(rssi))
-        parts.append(ssid)
-        parts.append(mac)
+        parts.extend((str(rssi), ssid.translate(SSID_UNSAFE), mac))
+        buckets.append((mac, rssi // RSSI_BUCKET_DB))
 
-    return ", ".join(parts)
+    return (",".join(parts) + "\n").encode(), hash(tuple(sorted(buckets)))
 
 # ────────────────────────────────────────────────
 # NETWORK TRANSMISSION
 # ────────────────────────────────────────────────
 
+frame_buf = deque(maxlen=BACKLOG_FRAMES)   # Encoded frames waiting to be sent (newest last)
+frame_lock = threading.Lock()   # Guards frame_buf across the scanner and sender threads
+frame_ready = threading.Event()
+new_connection = threading.Event()   # Set by the sender on connect; the next scan is sent in full
+
+def queue_frame(frame):
+    """Buffers a frame for the sender; the deque drops the oldest one when full."""
+    with frame_lock:
+        frame_buf.append(frame)
+    frame_ready.set()
+
+def drain_frames():
+    """Takes every buffered frame, oldest first."""
+    with frame_lock:
+        frames = list(frame_buf)
+        frame_buf.clear()
+    return frames
+
+def scanner_thread():
+    """
+    Producer: scans back-to-back every SCAN_INTERVAL and hands each DATA line
+    to the sender through frame_buf, so slow scans never hold up the socket.
+    Unchanged scans are replaced by a short heartbeat, with a full frame forced
+    every FORCE_SEND_EVERY cycles (and after each reconnect) so dashboard
+    nodes don't time out.
+    """
+    cycle = 0
+    last_sig, unchanged = None, 0
+    while True:
+        started = time.time()
+        try:
+            frame, sig = build_data_line(rescan=(cycle % RESCAN_EVERY == 0))
+            cycle += 1
+            if new_connection.is_set():
+                new_connection.clear()
+                last_sig = None   # A restarted dashboard has no state; don't answer with heartbeats
+            if sig == last_sig and unchanged < FORCE_SEND_EVERY - 1:
+                unchanged += 1
+                queue_frame(HEARTBEAT)
+            else:
+                last_sig, unchanged = sig, 0
+                queue_frame(frame)
+        except Exception:
+            # Keep the producer alive; a dead scanner would leave the sender idle forever
+            logging.exception("Scan cycle failed")
+            time.sleep(SCAN_INTERVAL)
+            continue
+        time.sleep(max(0.0, SCAN_INTERVAL - (time.time() - started)))
+
+@functools.lru_cache(maxsize=4)
+def resolve_server(host, port):
+    """
+    Resolves the dashboard address once; the cache is cleared when connecting fails.
+    Returns a numeric (host, port) that keeps any IPv6 scope id (e.g. fe80::1%wlan0).
+    """
+    sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4]
+    numeric_host, _ = socket.getnameinfo(sockaddr, socket.NI_NUMERICHOST | socket.NI_NUMERICSERV)
+    return numeric_host, port
+
 def sender_thread():
     """
     Main loop: Handles socket connection and periodic data relay.
-    Includes auto-reconnect logic if the dashboard is restarted.
+    Wakes as soon as a frame is buffered and sends everything pending in one
+    write, so frames collected while disconnected go out together on reconnect.
+    Includes auto-reconnect logic with exponential backoff if the dashboard is
+    restarted, and TCP keepalives so a silently dead peer is noticed.
     """
+    delay = 1.0
     while True:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(10)
-                print(f"[*] Connecting to Dashboard at {SERVER_IP}:{SERVER_PORT}...")
-                s.connect((SERVER_IP, SERVER_PORT))
+            print(f"[*] Connecting to Dashboard at {SERVER_IP}:{SERVER_PORT}...")
+            try:
+                # The 10s timeout covers the connect and every later send
+                s = socket.create_connection(resolve_server(SERVER_IP, SERVER_PORT), timeout=10)
+            except OSError:
+                resolve_server.cache_clear()   # Re-resolve in case SERVER_IP is a hostname that moved
+                raise
+            with s:
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # Don't Nagle-delay small DATA lines
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                if hasattr(socket, "TCP_KEEPIDLE"):
+                    # Linux: probe after 15s idle, every 5s, give up after 3 misses
+                    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 15)
+                    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5)
+                    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
                 print("[+] Connection established.")
+                new_connection.set()
                 
                 while True:
-                    data_line = build_data_line()
-                    print(f"[>] Sending data: {len(data_line)} bytes ({data_line.count(',')//2} nodes)")
-                    s.sendall((data_line + "\n").encode())
-                    time.sleep(SCAN_INTERVAL)
+                    frame_ready.wait()
+                    frame_ready.clear()
+                    frames = drain_frames()
+                    if not frames:
+                        continue
+                    payload = b"".join(frames)
+                    print(f"[>] Sending data: {len(payload)} bytes in {len(frames)} frame(s)")
+                    try:
+                        s.sendall(payload)   # One buffer, one write (TCP_NODELAY)
+                    except OSError:
+                        # Keep them for the next connection, still dropping the oldest first
+                        with frame_lock:
+                            kept = (frames + list(frame_buf))[-BACKLOG_FRAMES:]
+                            frame_buf.clear()
+                            frame_buf.extend(kept)
+                        raise
+                    delay = 1.0
         except Exception as e:
-            print(f"[!] Connection error: {e}. Retrying in 5 seconds...")
-            time.sleep(5)
+            delay = min(RETRY_MAX, delay * 2)
+            print(f"[!] Connection error: {e}. Retrying in {delay:.0f} seconds...")
+            time.sleep(delay + random.random())
 
 if __name__ == "__main__":
     print("="*40)
     print(" RPI NEIGHBOR COLLECTOR STARTING")
     print("="*40)
+    open_nl80211()
+    threading.Thread(target=scanner_thread, daemon=True).start()
     sender_thread()